@@ -1,12 +1,19 @@
 from __future__ import annotations
 from collections.abc import Iterable, Mapping, Sequence
-from typing import Callable, Generic, Optional, TypeVar
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Callable, Generic, Optional, TypeVar
 
-from collections import defaultdict
+from array import array
+from collections import deque
+import functools
 import graphviz
+import itertools
 
 import nfa
 
+if TYPE_CHECKING:
+    import numpy as np
+
 _T = TypeVar('_T')
 
 
@@ -19,7 +26,8 @@ class DFA(Generic[_T]):
                  final_states: Iterable[int]):
         self.states: set[int] = set(states)
         self.alphabet: set[_T] = set(alphabet)
-        self.transitions: dict[tuple[int, _T | str], int] = dict(transitions)
+        # Read-only, since accept, minimize and dump run on tables built from it once; minimize replaces it whole
+        self.transitions: Mapping[tuple[int, _T | str], int] = MappingProxyType(dict(transitions))
         self.start_state: int = start_state
         self.final_states: set[int] = set(final_states)
 
@@ -27,74 +35,62 @@ class DFA(Generic[_T]):
             raise ValueError('Start state must be in states')
         if any(state not in self.states for state in self.final_states):
             raise ValueError('All final states must be in states')
+        if any(src not in self.states or dst not in self.states for (src, _), dst in self.transitions.items()):
+            raise ValueError('All transitions must be between states in states')
+        if any(sym not in self.alphabet for _, sym in self.transitions):
+            raise ValueError('All transition symbols must be in alphabet')
 
-    def minimize(self) -> DFA[_T]:
-        reachable_states, reachable_finals = set(), set()
-        if self.start_state in self.final_states:
-            reachable_finals.add(self.start_state)
-        else:
-            reachable_states.add(self.start_state)
-
-        worklist = [self.start_state]
-        while len(worklist) > 0:
-            curr = worklist.pop()
-            for sym in self.alphabet:
-                if (curr, sym) in self.transitions:
-                    dst = self.transitions[(curr, sym)]
-                    if dst not in reachable_states and dst not in reachable_finals:
-                        if dst in self.final_states:
-                            reachable_finals.add(dst)
-                        else:
-                            reachable_states.add(dst)
-                        worklist.append(dst)
-
-        if len(reachable_finals) == 0:
-            self.states = {0}
-            self.transitions.clear()
-            self.start_state = 0
-            self.final_states.clear()
-            return self
-        if len(reachable_states) == 0:
-            partitions = [reachable_finals]
-        else:
-            partitions = [reachable_finals, reachable_states]
-        final_states = {0}
-        worklist = list(range(len(partitions)))
-        while len(worklist) > 0:
-            curr_part = partitions[worklist.pop()]
-            for sym in self.alphabet:
-                for index in range(len(partitions)):
-                    part = partitions[index]
-                    to_curr, not_to_curr = [], []
-                    for state in part:
-                        if (state, sym) in self.transitions and self.transitions[(state, sym)] in curr_part:
-                            to_curr.append(state)
-                        else:
-                            not_to_curr.append(state)
-                    if len(to_curr) == 0 or len(not_to_curr) == 0:
-                        continue
-                    partitions[index] = to_curr
-                    partitions.append(not_to_curr)
-                    if index in final_states:
-                        final_states.add(len(partitions) - 1)
-                    if index in worklist or len(to_curr) > len(not_to_curr):
-                        worklist.append(len(partitions) - 1)
-                    else:
-                        worklist.append(index)
-        state_map = {}
-        for index, states in enumerate(partitions):
-            for state in states:
-                state_map[state] = index
+        _build_table(self)
+
+    @classmethod
+    def from_table(cls,
+                   num_states: int,
+                   alphabet: Sequence[_T],
+                   table: Sequence[int],
+                   final_states: Iterable[int]) -> DFA[_T]:
+        # Row-major table over states 0..num_states-1 (0 is the start state) and the symbols in alphabet order,
+        # with -1 for a missing transition. The table is taken as is rather than rebuilt from the transition dict.
+        stride = max(len(alphabet), 1)
         transitions = {}
-        for index, states in enumerate(partitions):
-            for state in states:
-                for sym in self.alphabet:
-                    if (state, sym) in self.transitions:
-                        transitions[(index, sym)] = state_map[self.transitions[(state, sym)]]
-        self.states = set(range(len(partitions)))
-        self.transitions = transitions
-        self.start_state = state_map[self.start_state]
+        for index, dst in enumerate(table):
+            if dst >= 0:
+                transitions[index // stride, alphabet[index % stride]] = dst
+        retval = cls.__new__(cls)
+        retval.states = set(range(num_states))
+        retval.alphabet = set(alphabet)
+        retval.transitions = MappingProxyType(transitions)
+        retval.start_state = 0
+        retval.final_states = set(final_states)
+        _build_table(retval, alphabet, table)
+        return retval
+
+    def to_numpy_table(self, alphabet: Optional[Sequence[_T]] = None) -> tuple[np.ndarray, np.ndarray, int]:
+        # Transition table with one row per state plus an absorbing dead row last, which missing transitions and
+        # symbols outside the DFA's alphabet lead to; columns follow the given alphabet. Returned with which rows
+        # are accepting and the start row, so many strings can be run at once by indexing with a column per position.
+        import numpy as np
+
+        if alphabet is None:
+            alphabet = self._alphabet
+        stride = max(len(self._alphabet), 1)
+        dead = len(self._states)
+        rows = np.array(self._table, dtype=np.int64).reshape(dead, stride) // stride
+        rows[rows < 0] = dead
+        columns = np.array([self._sym_ids.get(sym, -1) for sym in alphabet], dtype=np.intp)
+        known = columns >= 0
+        table = np.full((dead + 1, len(columns)), dead, dtype=np.int32)
+        table[:dead, known] = rows[:, columns[known]]
+        accepting = np.zeros(dead + 1, dtype=bool)
+        accepting[[offset // stride for offset in self._final_offsets]] = True
+        return table, accepting, self._start_offset // stride
+
+    def minimize(self) -> DFA[_T]:
+        num_states, transitions, start_state, final_states = _minimize(self)
+        self.states = set(range(num_states))
+        self.transitions = MappingProxyType(transitions)
+        self.start_state = start_state
         self.final_states = final_states
+        _build_table(self)
         return self
 
     def to_nfa(self):
@@ -107,12 +103,7 @@ class DFA(Generic[_T]):
         return nfa.NFA(states, self.alphabet, transitions, self.start_state, final_state)
 
     def accept(self, string: Sequence[_T]) -> bool:
-        current_state = self.start_state
-        for sym in string:
-            if not (current_state, sym) in self.transitions:
-                return False
-            current_state = self.transitions[current_state, sym]
-        return current_state in self.final_states
+        return _accept(self, string)
 
     def dump(self,
              directory: str,
@@ -120,24 +111,230 @@ class DFA(Generic[_T]):
              caption: str = None,
              edge_label: Optional[Callable[[Iterable[_T]], str]] = None):
         if edge_label is None:
-            edge_label = _default_edge_label_function
+            edge_label = functools.partial(_default_edge_label_function, sym_str=self._sym_str)
         dot = graphviz.Digraph(name, graph_attr={'rankdir': 'LR', 'label': caption}, node_attr={'shape': 'circle'})
         start = graphviz.Digraph(graph_attr={'rank': 'source', 'margin': '0,0'})
         start.node('', shape='none', margin='0,0', width='0', fixedsize='true')
         dot.subgraph(start)
         for state in self.states:
             dot.node(str(state), shape=('doublecircle' if state in self.final_states else 'circle'))
-        edges = defaultdict(list)
-        for key, dst in self.transitions.items():
-            src, sym = key
-            edges[src, dst].append(sym)
-        for edge, syms in edges.items():
+        edge_src, edge_sym, edge_dst = self._edge_src, self._edge_sym, self._edge_dst
+        order = sorted(range(len(edge_src)), key=lambda i: (edge_src[i], edge_dst[i]))
+        for edge, group in itertools.groupby(order, key=lambda i: (edge_src[i], edge_dst[i])):
             src, dst = edge
-            label = edge_label(syms)
+            label = edge_label([edge_sym[i] for i in group])
             dot.edge(str(src), str(dst), label=label)
         dot.edge('', str(self.start_state))
         dot.render(directory=directory)
 
 
-def _default_edge_label_function(syms: Iterable[_T]) -> str:
+def _build_table(dfa: DFA[_T], alphabet: Optional[Sequence[_T]] = None, table: Optional[Sequence[int]] = None):
+    # Intern states and symbols to dense ids once; internal code works on these, only dump and to_nfa
+    # translate back to the original symbols. A table given by from_table already uses states 0..n-1 as rows
+    # and alphabet as its column order. The table helpers below are shared with dfa_immutable's DFA.
+    dfa._states = list(dfa.states) if table is None else list(range(len(dfa.states)))
+    dfa._alphabet = list(dfa.alphabet if alphabet is None else alphabet)
+    dfa._sym_ids = {sym: index for index, sym in enumerate(dfa._alphabet)}
+    dfa._sym_str = {sym: '\u03B5' if sym == '' else str(sym) for sym in dfa._alphabet}
+
+    # Flat row-major transition table; states are stored as row offsets, -1 marks a missing transition
+    stride = max(len(dfa._alphabet), 1)
+    offsets = {state: index * stride for index, state in enumerate(dfa._states)}
+    if table is None:
+        dfa._table = [-1] * (len(offsets) * stride)
+        for key, dst in dfa.transitions.items():
+            src, sym = key
+            dfa._table[offsets[src] + dfa._sym_ids[sym]] = offsets[dst]
+    else:
+        dfa._table = [dst * stride if dst >= 0 else -1 for dst in table]
+        dfa._table.extend([-1] * (len(offsets) * stride - len(dfa._table)))
+    # Parallel (src, sym, dst) edge arrays, used by dump
+    dfa._edge_src = [src for src, _ in dfa.transitions]
+    dfa._edge_sym = [sym for _, sym in dfa.transitions]
+    dfa._edge_dst = list(dfa.transitions.values())
+    dfa._start_offset = offsets[dfa.start_state]
+    dfa._final_offsets = {offsets[state] for state in dfa.final_states}
+
+    # Alphabets of latin-1 characters or byte values get a byte-indexed copy of the table, built on the first
+    # accept of str or bytes input by _build_byte_table
+    dfa._byte_table = None
+    if all(isinstance(sym, str) and len(sym) == 1 and ord(sym) < 256 for sym in dfa.alphabet):
+        dfa._byte_input, dfa._byte_of = str, ord
+    elif all(isinstance(sym, int) and 0 <= sym < 256 for sym in dfa.alphabet):
+        dfa._byte_input, dfa._byte_of = (bytes, bytearray), int
+    else:
+        dfa._byte_input = None
+
+
+def _build_byte_table(dfa: DFA[_T]):
+    # 256 columns plus an absorbing dead row, so scanning str or bytes input needs no symbol lookup or
+    # missing-transition check
+    rows = {state: index * 256 for index, state in enumerate(dfa._states)}
+    dead = len(rows) * 256
+    byte_table = [dead] * (dead + 256)
+    for key, dst in dfa.transitions.items():
+        src, sym = key
+        byte_table[rows[src] + dfa._byte_of(sym)] = rows[dst]
+    dfa._byte_start = rows[dfa.start_state]
+    dfa._byte_finals = {rows[state] for state in dfa.final_states}
+    dfa._byte_table = byte_table
+
+
+def _minimize(dfa: DFA[_T]) -> tuple[int, dict[tuple[int, _T], int], int, set[int]]:
+    # Minimal DFA of the given one, as its number of states (numbered from 0), transitions, start and final states.
+    # Forward table over the interned state and symbol ids, shared by every phase below; -1 marks a missing
+    # transition (row offsets floor-divide to row ids, and -1 // stride == -1)
+    states, alphabet = dfa._states, dfa._alphabet
+    stride = max(len(alphabet), 1)
+    fwd = [array('i', [dst // stride for dst in dfa._table[offset:offset + len(alphabet)]])
+           for offset in range(0, len(dfa._table), stride)]
+    is_final = bytearray(state in dfa.final_states for state in states)
+
+    start = dfa._start_offset // stride
+    reachable = bytearray(len(states))
+    reachable[start] = 1
+    worklist = deque((start,))
+    while len(worklist) > 0:
+        curr = worklist.popleft()
+        for dst in fwd[curr]:
+            if dst >= 0 and not reachable[dst]:
+                reachable[dst] = 1
+                worklist.append(dst)
+
+    # Refine the reachable states into equivalence classes. Missing transitions go to an implicit sink state,
+    # added as the last row so that -1 indexes it directly. The sink starts in a class of its own, so dead states
+    # of the input are never merged into it and are kept. If no final state is reachable, every state is dead
+    # and the sink is left with them, which reduces the result to a single state.
+    fwd.append(array('i', [-1]) * len(alphabet))
+    is_final.append(0)
+    reachable.append(1)
+    reachable_states = [state for state in range(len(fwd)) if reachable[state]]
+    initial_class = bytearray(is_final)
+    if any(is_final[state] for state in reachable_states):
+        initial_class[-1] = 2
+    refine = _refine_moore if len(alphabet) > len(states) else _refine_hopcroft
+    class_of = refine(fwd, reachable_states, initial_class)
+
+    # Classes are numbered in order of their first reachable state, which also serves as the class's
+    # representative. The sink's class is dropped, along with every transition into it, unless it holds the
+    # start state (an empty language), in which case it is kept as the only state.
+    sink_class = class_of[len(states)]
+    class_ids, representatives = {}, []
+    for state in reachable_states:
+        state_class = class_of[state]
+        if state_class not in class_ids and (state_class != sink_class or state_class == class_of[start]):
+            class_ids[state_class] = len(representatives)
+            representatives.append(state)
+    final_states = {index for index, state in enumerate(representatives) if is_final[state]}
+    # Equivalent states agree on every transition, so each class is rebuilt from its representative
+    transitions = {}
+    for index, representative in enumerate(representatives):
+        for sym, dst in enumerate(fwd[representative]):
+            if class_of[dst] != sink_class:
+                transitions[index, alphabet[sym]] = class_ids[class_of[dst]]
+    return len(representatives), transitions, class_ids[class_of[start]], final_states
+
+
+def _accept(dfa: DFA[_T], string: Sequence[_T]) -> bool:
+    if dfa._byte_input is not None and isinstance(string, dfa._byte_input):
+        return _accept_bytes(dfa, string)
+    table, sym_ids = dfa._table, dfa._sym_ids
+    current_state = dfa._start_offset
+    for sym in string:
+        sym_id = sym_ids.get(sym, -1)
+        if sym_id < 0:
+            return False
+        current_state = table[current_state + sym_id]
+        if current_state < 0:
+            return False
+    return current_state in dfa._final_offsets
+
+
+def _accept_bytes(dfa: DFA[_T], string: str | bytes | bytearray) -> bool:
+    if isinstance(string, str):
+        try:
+            string = string.encode('latin-1')
+        except UnicodeEncodeError:
+            return False
+    if dfa._byte_table is None:
+        _build_byte_table(dfa)
+    table = dfa._byte_table
+    current_state = dfa._byte_start
+    for byte in string:
+        current_state = table[current_state + byte]
+    return current_state in dfa._byte_finals
+
+
+def _refine_hopcroft(fwd: list[array], states: list[int], initial_class: Sequence[int]) -> list[int]:
+    # Hopcroft's algorithm, returning the class of every state (entries for states not given are meaningless).
+    # Splitters are whole classes: for each symbol, the splitter's predecessors are bucketed by their current class,
+    # so only classes holding a predecessor are visited, and each is split by the symbol. The largest piece of a
+    # split class keeps its index and the rest are queued, which covers both of Hopcroft's cases (class pending or
+    # not) without tracking what is pending.
+    num_syms = len(fwd[0])
+    pred = [[[] for _ in range(num_syms)] for _ in fwd]
+    for state in states:
+        for sym, dst in enumerate(fwd[state]):
+            pred[dst][sym].append(state)
+
+    class_of = [0] * len(fwd)
+    members = []
+    class_ids = {}
+    for state in states:
+        index = class_ids.setdefault(initial_class[state], len(members))
+        if index == len(members):
+            members.append(set())
+        members[index].add(state)
+        class_of[state] = index
+
+    largest = max(range(len(members)), key=lambda index: len(members[index]))
+    worklist = [index for index in range(len(members)) if index != largest]
+    while len(worklist) > 0:
+        splitter = list(members[worklist.pop()])
+        for sym in range(num_syms):
+            touched = {}
+            for dst in splitter:
+                for src in pred[dst][sym]:
+                    moved = touched.get(class_of[src])
+                    if moved is None:
+                        touched[class_of[src]] = [src]
+                    else:
+                        moved.append(src)
+            for index, moved in touched.items():
+                block = members[index]
+                if len(moved) == len(block):
+                    continue
+                block.difference_update(moved)
+                moved = set(moved)
+                if len(moved) > len(block):
+                    members[index], moved = moved, block
+                new_index = len(members)
+                members.append(moved)
+                for state in moved:
+                    class_of[state] = new_index
+                worklist.append(new_index)
+    return class_of
+
+
+def _refine_moore(fwd: list[array], states: list[int], initial_class: Sequence[int]) -> list[int]:
+    # Moore's algorithm: split every class by the classes of its states' successors until no class splits. Each pass
+    # is one signature per state, which beats per-symbol splitters when the alphabet is large.
+    class_of = list(initial_class)
+    num_classes = len({class_of[state] for state in states})
+    while True:
+        signatures = {}
+        new_class_of = class_of[:]
+        for state in states:
+            signature = (class_of[state], tuple(map(class_of.__getitem__, fwd[state])))
+            new_class_of[state] = signatures.setdefault(signature, len(signatures))
+        class_of = new_class_of
+        if len(signatures) == num_classes:
+            break
+        num_classes = len(signatures)
+    return class_of
+
+
+def _default_edge_label_function(syms: Iterable[_T], sym_str: Optional[Mapping[_T, str]] = None) -> str:
+    if sym_str is not None:
+        return ','.join(sorted(sym_str[sym] for sym in syms))
     return ','.join(sorted('\u03B5' if sym == '' else str(sym) for sym in syms))
@@ -1,10 +1,13 @@
 from __future__ import annotations
-from collections.abc import Iterable, Sequence
+from collections.abc import Iterable, Mapping, Sequence
+from types import MappingProxyType
 from typing import Callable, Generic, Optional, TypeVar
 
-from collections import defaultdict
+import functools
 import graphviz
+import itertools
 
+from dfa import _accept, _build_table, _minimize
 import nfa
 
 _T = TypeVar('_T')
@@ -14,80 +17,29 @@ class DFA(Generic[_T]):
     def __init__(self,
                  states: frozenset[int],
                  alphabet: frozenset[_T],
-                 transitions: dict[tuple[int, _T], int],
+                 transitions: Mapping[tuple[int, _T], int],
                  start_state: int,
                  final_states: frozenset[int]):
         if start_state not in states:
             raise ValueError('Start state must be in states')
         if any(state not in states for state in final_states):
             raise ValueError('All final states must be in states')
+        if any(src not in states or dst not in states for (src, _), dst in transitions.items()):
+            raise ValueError('All transitions must be between states in states')
+        if any(sym not in alphabet for _, sym in transitions):
+            raise ValueError('All transition symbols must be in alphabet')
 
         self.states = states
         self.alphabet = alphabet
-        self.transitions = transitions.copy()
+        # Read-only view rather than a copy: callers must not mutate the dict after passing it in
+        self.transitions = MappingProxyType(transitions)
         self.start_state = start_state
         self.final_states = final_states
+        _build_table(self)
 
     def minimize(self) -> DFA[_T]:
-        reachable_states, reachable_finals = set(), set()
-        if self.start_state in self.final_states:
-            reachable_finals.add(self.start_state)
-        else:
-            reachable_states.add(self.start_state)
-
-        worklist = [self.start_state]
-        while len(worklist) > 0:
-            curr = worklist.pop()
-            for sym in self.alphabet:
-                if (curr, sym) in self.transitions:
-                    dst = self.transitions[(curr, sym)]
-                    if dst not in reachable_states and dst not in reachable_finals:
-                        if dst in self.final_states:
-                            reachable_finals.add(dst)
-                        else:
-                            reachable_states.add(dst)
-                        worklist.append(dst)
-
-        partitions = [reachable_states, reachable_finals]
-        final_states = {1}
-        worklist = [0, 1]
-        while len(worklist) > 0:
-            curr_part = partitions[worklist.pop()]
-            for sym in self.alphabet:
-                for index in range(len(partitions)):
-                    part = partitions[index]
-                    to_curr, not_to_curr = [], []
-                    for state in part:
-                        if (state, sym) in self.transitions and self.transitions[(state, sym)] in curr_part:
-                            to_curr.append(state)
-                        else:
-                            not_to_curr.append(state)
-                    if len(to_curr) == 0 or len(not_to_curr) == 0:
-                        continue
-                    partitions[index] = to_curr
-                    partitions.append(not_to_curr)
-                    if index in final_states:
-                        final_states.add(len(partitions) - 1)
-                    if index in worklist or len(to_curr) > len(not_to_curr):
-                        worklist.append(len(partitions) - 1)
-                    else:
-                        worklist.append(index)
-        state_map = {}
-        for index, states in enumerate(partitions):
-            for state in states:
-                state_map[state] = index
-        transitions = {}
-        for index, states in enumerate(partitions):
-            for state in states:
-                for sym in self.alphabet:
-                    if (state, sym) in self.transitions:
-                        transitions[(index, sym)] = state_map[self.transitions[(state, sym)]]
-
-        return DFA(frozenset(range(len(partitions))),
-                   self.alphabet,
-                   transitions,
-                   state_map[self.start_state],
-                   frozenset(final_states))
+        num_states, transitions, start_state, final_states = _minimize(self)
+        return DFA(frozenset(range(num_states)), self.alphabet, transitions, start_state, frozenset(final_states))
 
     def to_nfa(self):
         max_s = max(self.states)
@@ -99,31 +51,46 @@ class DFA(Generic[_T]):
         return nfa.NFA(states, self.alphabet, transitions, self.start_state, final_state)
 
     def accept(self, string: Sequence[_T]) -> bool:
-        current_state = self.start_state
-        for sym in string:
-            if not (current_state, sym) in self.transitions:
-                return False
-            current_state = self.transitions[(current_state, sym)]
-        return current_state in self.final_states
+        return _accept(self, string)
+
+    def compile_accept(self) -> Callable[[Sequence[_T]], bool]:
+        # Specialize accept to this DFA: dense row ids, with the start row baked in as a constant
+        rows = {state: index for index, state in enumerate(self.states)}
+        dispatch = tuple({} for _ in rows)
+        for key, dst in self.transitions.items():
+            src, sym = key
+            dispatch[rows[src]][sym] = rows[dst]
+        finals = frozenset(rows[state] for state in self.final_states)
+        source = ('def accept(string, _dispatch=_dispatch, _finals=_finals):\n'
+                  f'    current_state = {rows[self.start_state]}\n'
+                  '    for sym in string:\n'
+                  '        current_state = _dispatch[current_state].get(sym, -1)\n'
+                  '        if current_state < 0:\n'
+                  '            return False\n'
+                  '    return current_state in _finals\n')
+        namespace = {'_dispatch': dispatch, '_finals': finals}
+        exec(compile(source, '<dfa accept>', 'exec'), namespace)
+        self.accept = namespace['accept']
+        return self.accept
 
     def dump(self, directory, name='dfa', edge_label: Optional[Callable[[Iterable[_T]], str]] = None):
         if edge_label is None:
-            edge_label = _default_edge_label_function
+            edge_label = functools.partial(_default_edge_label_function, sym_str=self._sym_str)
         dot = graphviz.Digraph(name, graph_attr={'rankdir': 'LR'}, node_attr={'shape': 'circle'})
         for state in self.states:
             dot.node(str(state), shape=('doublecircle' if state in self.final_states else 'circle'))
-        edges = defaultdict(list)
-        for key, dst in self.transitions.items():
-            src, sym = key
-            edges[(src, dst)].append(sym)
-        for edge, syms in edges.items():
+        edge_src, edge_sym, edge_dst = self._edge_src, self._edge_sym, self._edge_dst
+        order = sorted(range(len(edge_src)), key=lambda i: (edge_src[i], edge_dst[i]))
+        for edge, group in itertools.groupby(order, key=lambda i: (edge_src[i], edge_dst[i])):
             src, dst = edge
-            label = edge_label(syms)
+            label = edge_label([edge_sym[i] for i in group])
             dot.edge(str(src), str(dst), label=label)
         dot.node('', shape='none')
         dot.edge('', str(self.start_state))
         dot.render(directory=directory)
 
 
-def _default_edge_label_function(syms: Iterable[_T]) -> str:
+def _default_edge_label_function(syms: Iterable[_T], sym_str: Optional[Mapping[_T, str]] = None) -> str:
+    if sym_str is not None:
+        return ','.join(sorted(sym_str[sym] for sym in syms))
     return ','.join(sorted('\u03B5' if sym == '' else str(sym) for sym in syms))
@@ -1,6 +1,7 @@
 import itertools
 import math
-from collections import defaultdict
+
+import numpy as np
 
 from nfa import NFA
 
@@ -10,84 +11,98 @@ import random
 # Reference: Robert A. Wagner. 1974. Order-n correction for regular languages. Commun. ACM 17, 5 (May 1974), 265–268.
 # DOI:https://doi.org/10.1145/360980.360995
 
+# Sentinel for "no path"; every real path length is bounded by the number of states
+_INF = 32000
+
+
+def distance_table(nfa: NFA, string: str, debug: bool = False) -> dict[int, list[tuple[int | float, ...]]]:
+    states = sorted(nfa.states)
+    state_ids = {state: index for index, state in enumerate(states)}
+    sym_ids = {sym: index for index, sym in enumerate(nfa.alphabet)}
+    n = len(states)
+
+    # Shortest paths are compared lexicographically by (symbol edges, epsilon edges)
+    sym_lengths = np.full((n, n), _INF, dtype=np.int16)
+    eps_lengths = np.full((n, n), _INF, dtype=np.int16)
+    included_syms = np.zeros((n, n, len(sym_ids)), dtype=bool)
+    for key, dsts in nfa.transitions.items():
+        src, sym = key
+        if sym != '':
+            for dst in dsts:
+                start, end = state_ids[src], state_ids[dst]
+                sym_lengths[start, end], eps_lengths[start, end] = 1, 0
+                included_syms[start, end, sym_ids[sym]] = True
+    for key, dsts in nfa.transitions.items():
+        src, sym = key
+        if sym == '':
+            for dst in dsts:
+                start, end = state_ids[src], state_ids[dst]
+                sym_lengths[start, end], eps_lengths[start, end] = 0, 1
+                included_syms[start, end] = False
+    for k in range(n):
+        thru_sym = np.minimum(sym_lengths[:, k, None].astype(np.int32) + sym_lengths[None, k, :], _INF)
+        thru_eps = np.minimum(eps_lengths[:, k, None].astype(np.int32) + eps_lengths[None, k, :], _INF)
+        thru_included = included_syms[:, k, None, :] | included_syms[None, k, :, :]
+        shorter = thru_sym < sym_lengths
+        tied = (thru_sym == sym_lengths) & (thru_sym < _INF)
+        np.copyto(included_syms, thru_included, where=shorter[:, :, None])
+        included_syms |= tied[:, :, None] & thru_included
+        better = shorter | (tied & (thru_eps < eps_lengths))
+        np.copyto(sym_lengths, thru_sym, casting='same_kind', where=better)
+        np.copyto(eps_lengths, thru_eps, casting='same_kind', where=better)
+
+    lengths = np.where(sym_lengths >= _INF, np.inf, sym_lengths)
+
+    start = state_ids[nfa.start_state]
+    costs = lengths[start].copy()
+    costs[start] = 0
+    table: dict[int, list[tuple[int | float, ..., int]]]
+    table = {state: [(costs[index].item(), nfa.start_state)] for index, state in enumerate(states)}
 
-def distance_table(nfa: NFA, string: str) -> dict[int, list[tuple[int | float, ...]]]:
-    path_lengths: dict[tuple[int, int], tuple[float, float]] = {}
-    # eps_lengths: dict[tuple[int, int], float] = {}
-    included_syms = defaultdict(bool)
-    for start in nfa.states:
-        for end in nfa.states:
-            if (start, '') in nfa.transitions and end in nfa.transitions[start, '']:
-                path_lengths[start, end] = (0, 1)
-            else:
-                for sym in nfa.alphabet:
-                    if (start, sym) in nfa.transitions and end in nfa.transitions[start, sym]:
-                        path_lengths[start, end] = (1, 0)
-                        included_syms[start, end, sym] = True
-                path_lengths.setdefault((start, end), (math.inf, math.inf))
-    for k in nfa.states:
-        new_path_lengths = {}
-        new_included_syms = {}
-        for start in nfa.states:
-            for end in nfa.states:
-                current = path_lengths[start, end]
-                thru_k = (path_lengths[start, k][0] + path_lengths[k, end][0],
-                          path_lengths[start, k][1] + path_lengths[k, end][1])
-                new_path_lengths[start, end] = min(current, thru_k)
-                for sym in nfa.alphabet:
-                    if current[0] < thru_k[0] or (math.isinf(current[0]) and math.isinf(thru_k[0])):
-                        new_included_syms[start, end, sym] = included_syms[start, end, sym]
-                    elif current[0] > thru_k[0]:
-                        new_included_syms[start, end, sym] = included_syms[start, k, sym] or included_syms[k, end, sym]
-                    else:
-                        new_included_syms[start, end, sym] = included_syms[start, end, sym] or \
-                                                             included_syms[start, k, sym] or included_syms[k, end, sym]
-        path_lengths = new_path_lengths
-        included_syms = new_included_syms
+    # Cost of consuming one symbol between every pair of states, built once per distinct symbol
+    edge_costs: dict[str, np.ndarray] = {}
+    columns = np.arange(n)
+    for sym in string:
+        if sym not in edge_costs:
+            sym_index = sym_ids.get(sym)
+            included = False if sym_index is None else included_syms[:, :, sym_index]
+            edge_costs[sym] = np.where(lengths == 0, 1, lengths - included)
+        totals = costs[:, None] + edge_costs[sym]
+        # argmin keeps the first minimum, i.e. the lowest-numbered source state, as the tuple min did
+        best = totals.argmin(axis=0)
+        costs = totals[best, columns]
+        for index, state in enumerate(states):
+            table[state].append((costs[index].item(), states[best[index]]))
+
+    if debug:
+        _print_distance_table(nfa, string, states, lengths.tolist(), table)
+
+    return table
 
+
+def _print_distance_table(nfa: NFA,
+                          string: str,
+                          states: list[int],
+                          lengths: list[list[int | float]],
+                          table: dict[int, list[tuple[int | float, ..., int]]]):
     print('   ', end='')
-    for end in nfa.states:
+    for end in states:
         print('{:>2d}'.format(end), end=' ')
     print()
-    for start in nfa.states:
-        print('{:>2d}'.format(start), end=' ')
-        for end in nfa.states:
-            if math.isinf(path_lengths[start, end][0]):
+    for start in range(len(states)):
+        print('{:>2d}'.format(states[start]), end=' ')
+        for end in range(len(states)):
+            if math.isinf(lengths[start][end]):
                 print(' . ', end='')
             else:
-                print('{:>2.0f}'.format(path_lengths[start, end][0]), end=' ')
+                print('{:>2.0f}'.format(lengths[start][end]), end=' ')
         print()
-    # print(included_syms)
-
-    table: dict[int, list[tuple[int | float, ..., int]]]
-    table = {state: [(0 if state == nfa.start_state else path_lengths[nfa.start_state, state][0],
-                      nfa.start_state)]
-             for state in nfa.states}
-
-    for ln, sym in enumerate(string):
-        for state in nfa.states:
-            min_val = (math.inf, math.inf)
-            for src in nfa.states:
-                prev_cost = table[src][ln][0]
-                if path_lengths[src, state][0] == 0:
-                    edge_cost = 1
-                else:
-                    edge_cost = path_lengths[src, state][0] - included_syms.setdefault((src, state, sym), False)
-                # if src == state and edge_cost > 1:
-                #     edge_cost = 1
-
-                # print('{:>2d} -> {:>2d} = {:>3.0f} + {:>3.0f}; {:>3.0f}/{:>3.0f}'.format(src, state, prev_cost, edge_cost, eps_lengths[nfa.start_state, src], eps_lengths[src, state]))
-
-                min_val = min(min_val, (prev_cost + edge_cost,
-                                        src))
-            table[state].append(min_val)
-        # print()
 
     print(' ' * 10, end='')
     for sym in string:
         print('{:>6}'.format(sym), end=' ')
     print()
-    for state in nfa.states:
+    for state in states:
         print('{}S{:<2d}{}'.format('>' if state == nfa.final_state else ' ',
                                    state,
                                    '>' if state == nfa.start_state else ' '), end=' ')
@@ -112,11 +127,9 @@ def distance_table(nfa: NFA, string: str) -> dict[int, list[tuple[int | float, .
     transitions = 'S{:<2d}'.format(curr_state) + transitions
     print('             ' + '       '.join(string) + '\n' + transitions)
 
-    return table
-
 
-def update_nfa(nfa: NFA, string: str) -> NFA:
-    table = distance_table(nfa, string)
+def update_nfa(nfa: NFA, string: str, debug: bool = False) -> NFA:
+    table = distance_table(nfa, string, debug)
 
     nfa.alphabet.update(string)
 
@@ -125,8 +138,9 @@ def update_nfa(nfa: NFA, string: str) -> NFA:
         prev_state = table[curr_state][i][-1]
         new = True  # table[curr_state][i][3]
         if new:
-            nfa.transitions[prev_state, '' if i == 0 else string[i - 1]].add(curr_state)
-        print(prev_state, curr_state, string[i - 1], new)
+            nfa.add_transitions(prev_state, '' if i == 0 else string[i - 1], (curr_state,))
+        if debug:
+            print(prev_state, curr_state, string[i - 1], new)
         curr_state = prev_state
 
     return nfa
@@ -160,7 +174,7 @@ if __name__ == '__main__':
     nfa = parsing.parse_regex_as_nfa(inp[0], use_eps=True)  # .to_dfa().minimize().to_nfa()
     nfa.dump('./graphs')
     for string in inp[1:2]:
-        update_nfa(nfa, string)
+        update_nfa(nfa, string, debug=True)
         if not nfa.accept(string):
             nfa.dump('./graphs', 'nnfa')
             assert False
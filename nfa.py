@@ -3,6 +3,8 @@ from collections.abc import Iterable, Mapping, Sequence
 from typing import Any, Callable, Generic, Optional, TypeVar
 
 from collections import defaultdict
+from types import MappingProxyType
+import functools
 import graphviz
 
 import dfa
@@ -10,8 +12,16 @@ import dfa
 _S = TypeVar('_S')
 _T = TypeVar('_T')
 
+_NO_EDGES = MappingProxyType({})
+# Most steps NFA.online_accept keeps per automaton
+_ONLINE_MOVES_LIMIT = 4096
+
 
 class NFA(Generic[_T]):
+    __slots__ = ('states', 'alphabet', 'transitions', 'start_state', 'final_state',
+                 '_out', '_in', '_eps_cache', '_eps_sets', '_delta_cache', '_online_moves',
+                 '_min_state', '_max_state')
+
     def __init__(self,
                  states: Iterable[int],
                  alphabet: Iterable[_T],
@@ -20,9 +30,20 @@ class NFA(Generic[_T]):
                  final_state: int):
         self.states: set[int] = set(states)
         self.alphabet: set[_T] = set(alphabet)
-        self.transitions: defaultdict[tuple[int, _T | str], set[int]] = defaultdict(set)
-        for key, dsts in transitions.items():
-            self.transitions[key].update(dsts)
+        self.transitions: defaultdict[tuple[int, _T | str], set[int]] = defaultdict(
+            set, {key: set(dsts) for key, dsts in transitions.items()})
+        # Adjacency indexes over the same sets as transitions: src -> sym -> dsts, and dst -> {(src, sym)}
+        self._out: dict[int, dict[_T | str, set[int]]] = {}
+        self._in: dict[int, set[tuple[int, _T | str]]] = {}
+        # Epsilon closures, cleared whenever an epsilon edge changes: as bitmasks including the state itself, and
+        # as the sets eps_closure returns, which include the state only if it is on an epsilon cycle
+        self._eps_cache: dict[int, int] = {}
+        self._eps_sets: dict[int, frozenset[int]] = {}
+        # Per state, its successors on each symbol taken from anywhere in its epsilon closure, cleared on any change
+        self._delta_cache: dict[int, dict[_T | str, frozenset[int]]] = {}
+        # Steps taken by online_accept, from an epsilon-closed state mask on a symbol, cleared on any change
+        self._online_moves: dict[tuple[int, _T], int] = {}
+        self._reindex()
         self.start_state = start_state
         self.final_state = final_state
 
@@ -30,6 +51,87 @@ class NFA(Generic[_T]):
             raise ValueError('Start state must be in states')
         if self.final_state not in self.states:
             raise ValueError('Final state must be in states')
+        if any(src not in self.states or not dsts <= self.states for (src, _), dsts in self.transitions.items()):
+            raise ValueError('All transitions must be between states in states')
+        # States double as bit positions in the state-set masks that accept, online_accept and to_dfa work on
+        if any(state < 0 for state in self.states):
+            raise ValueError('States must be non-negative')
+        self._update_bounds()
+
+    def _update_bounds(self):
+        # Smallest and largest state numbers, kept so new states can be numbered without scanning self.states
+        self._min_state, self._max_state = min(self.states), max(self.states)
+
+    def _invalidate_eps(self):
+        self._eps_cache.clear()
+        self._eps_sets.clear()
+        self._delta_cache.clear()
+        self._online_moves.clear()
+
+    def add_transitions(self, src: int, sym: _T | str, dsts: Iterable[int]):
+        if sym == '':
+            if self._eps_cache or self._eps_sets:
+                self._invalidate_eps()
+        else:
+            if self._delta_cache:
+                self._delta_cache.clear()
+            if self._online_moves:
+                self._online_moves.clear()
+        # Existing keys are found through the source's row; the (src, sym) map is only probed for new ones
+        key = (src, sym)
+        row = self._out.get(src)
+        if row is None:
+            row = self._out[src] = {}
+        targets = row.get(sym)
+        if targets is None:
+            targets = row[sym] = self.transitions[key]
+        for dst in dsts:
+            targets.add(dst)
+            in_keys = self._in.get(dst)
+            if in_keys is None:
+                self._in[dst] = {key}
+            else:
+                in_keys.add(key)
+
+    def _reindex(self):
+        self._out, self._in = {}, {}
+        self._invalidate_eps()
+        for key, dsts in self.transitions.items():
+            src, sym = key
+            self._out.setdefault(src, {})[sym] = dsts
+            for dst in dsts:
+                self._in.setdefault(dst, set()).add(key)
+
+    def _prune(self):
+        # Drop states that are unreachable from the start state or cannot reach the final state. concat and union
+        # call this since they bring in another automaton's states; the other operations never make a state useless.
+        forward, worklist = {self.start_state}, [self.start_state]
+        while len(worklist) > 0:
+            for dsts in self._out.get(worklist.pop(), _NO_EDGES).values():
+                for dst in dsts:
+                    if dst not in forward:
+                        forward.add(dst)
+                        worklist.append(dst)
+        backward, worklist = {self.final_state}, [self.final_state]
+        while len(worklist) > 0:
+            for src, _ in self._in.get(worklist.pop(), ()):
+                if src not in backward:
+                    backward.add(src)
+                    worklist.append(src)
+        useful = forward & backward
+        useful.update((self.start_state, self.final_state))
+        if len(useful) == len(self.states):
+            return
+        transitions = defaultdict(set)
+        for key, dsts in self.transitions.items():
+            if key[0] in useful:
+                dsts = dsts & useful
+                if len(dsts) > 0:
+                    transitions[key] = dsts
+        self.states = useful
+        self.transitions = transitions
+        self._reindex()
+        self._update_bounds()
 
     def copy(self) -> NFA[_T]:
         return NFA(self.states, self.alphabet, self.transitions, self.start_state, self.final_state)
@@ -39,16 +141,16 @@ class NFA(Generic[_T]):
 
     def concat(self, other: NFA[_S]) -> NFA[_S | _T]:
         self.alphabet.update(other.alphabet)
-        max_s = max(self.states)
-        min_o = min(other.states)
-        corr = max_s - min_o + 1
-        self.states.update(state + corr for state in other.states if state != other.start_state)
-        for key, dst in other.transitions.items():
+        corr = self._max_state - other._min_state + 1
+        state_map = {state: state + corr for state in other.states}
+        state_map[other.start_state] = self.final_state
+        self.states.update(state_map.values())
+        self._max_state = max(self._max_state, max(state_map.values()))
+        for key, dsts in other.transitions.items():
             src, sym = key
-            new_key = (self.final_state if src == other.start_state else src + corr, sym)
-            new_dst = (self.final_state if state == other.start_state else state + corr for state in dst)
-            self.transitions[new_key].update(new_dst)
-        self.final_state = other.final_state + corr
+            self.add_transitions(state_map[src], sym, map(state_map.__getitem__, dsts))
+        self.final_state = state_map[other.final_state]
+        self._prune()
         return self
 
     def __or__(self, other: NFA[_S]) -> NFA[_S | _T]:
@@ -56,43 +158,83 @@ class NFA(Generic[_T]):
 
     def union(self, other: NFA[_S]) -> NFA[_S | _T]:
         self.alphabet.update(other.alphabet)
-        max_s = max(self.states)
-        min_o = min(other.states)
-        corr = max_s - min_o + 1
-        self.states.update(state + corr for state in other.states
-                           if state != other.start_state and state != other.final_state)
+        corr = self._max_state - other._min_state + 1
+        state_map = {state: state + corr for state in other.states}
+        state_map[other.start_state] = self.start_state
+        state_map[other.final_state] = self.final_state
+        self.states.update(state_map.values())
+        self._max_state = max(self._max_state, max(state_map.values()))
         for key, dsts in other.transitions.items():
             src, sym = key
-            new_key = (self.final_state if src == other.final_state else (
-                self.start_state if src == other.start_state else src + corr), sym)
-            new_dsts = (self.final_state if dst == other.final_state else
-                        (self.start_state if dst == other.start_state else dst + corr)
-                        for dst in dsts)
-            self.transitions[new_key].update(new_dsts)
+            self.add_transitions(state_map[src], sym, map(state_map.__getitem__, dsts))
+        self._prune()
         return self
 
+    @classmethod
+    def concat_all(cls, nfas: Iterable[NFA[_T]]) -> NFA[_T]:
+        # Same result as chaining +, but every part is renumbered and copied into one transition dict and the
+        # whole is pruned once, rather than building and pruning an intermediate automaton per part
+        return cls._join(nfas, False)
+
+    @classmethod
+    def union_all(cls, nfas: Iterable[NFA[_T]]) -> NFA[_T]:
+        # Same result as chaining |: every part shares the first part's start and final states
+        return cls._join(nfas, True)
+
+    @classmethod
+    def _join(cls, nfas: Iterable[NFA[_T]], union: bool) -> NFA[_T]:
+        nfas = list(nfas)
+        if len(nfas) == 0:
+            raise ValueError('At least one NFA is required')
+        first = nfas[0]
+        states, alphabet = set(first.states), set(first.alphabet)
+        transitions = {key: set(dsts) for key, dsts in first.transitions.items()}
+        start_state, final_state = first.start_state, first.final_state
+        max_state = first._max_state
+        for other in nfas[1:]:
+            alphabet.update(other.alphabet)
+            corr = max_state - other._min_state + 1
+            state_map = {state: state + corr for state in other.states}
+            if union:
+                state_map[other.start_state] = start_state
+                state_map[other.final_state] = final_state
+            else:
+                state_map[other.start_state] = final_state
+                final_state = state_map[other.final_state]
+            states.update(state_map.values())
+            max_state = max(max_state, max(state_map.values()))
+            for key, dsts in other.transitions.items():
+                src, sym = key
+                targets = transitions.get((state_map[src], sym))
+                if targets is None:
+                    targets = transitions[state_map[src], sym] = set()
+                targets.update(map(state_map.__getitem__, dsts))
+        retval = cls(states, alphabet, transitions, start_state, final_state)
+        retval._prune()
+        return retval
+
     def star(self) -> NFA[_T]:
-        max_s = max(self.states)
-        start_state = max_s + 1
-        final_state = max_s + 2
+        start_state = self._max_state + 1
+        final_state = self._max_state + 2
         self.states.update((start_state, final_state))
-        self.transitions[start_state, ''].update((self.start_state, final_state))
-        self.transitions[self.final_state, ''].update((self.start_state, final_state))
+        self._max_state = final_state
+        self.add_transitions(start_state, '', (self.start_state, final_state))
+        self.add_transitions(self.final_state, '', (self.start_state, final_state))
         self.start_state, self.final_state = start_state, final_state
         return self
 
     def plus(self) -> NFA[_T]:
-        max_s = max(self.states)
-        start_state = max_s + 1
-        final_state = max_s + 2
+        start_state = self._max_state + 1
+        final_state = self._max_state + 2
         self.states.update((start_state, final_state))
-        self.transitions[start_state, ''].add(self.start_state)
-        self.transitions[self.final_state, ''].update((self.start_state, final_state))
+        self._max_state = final_state
+        self.add_transitions(start_state, '', (self.start_state,))
+        self.add_transitions(self.final_state, '', (self.start_state, final_state))
         self.start_state, self.final_state = start_state, final_state
         return self
 
     def opt(self) -> NFA[_T]:
-        self.transitions[self.start_state, ''].add(self.final_state)
+        self.add_transitions(self.start_state, '', (self.final_state,))
         return self
 
     def __sub__(self, other) -> NFA[_T]:
@@ -107,163 +249,222 @@ class NFA(Generic[_T]):
         if state == self.start_state or state == self.final_state:
             raise ValueError('Cannot rip the start or final state')
         outgoing_transitions, self_loops = dict(), set()
-        for key, dsts in self.transitions.items():
-            src, sym = key
-            if src == state:
-                if state in dsts:
-                    if len(dsts) > 1:
-                        outgoing_transitions[sym] = dsts.difference((state,))
-                    if sym != '':
-                        self_loops.add(sym)
-                else:
-                    outgoing_transitions[sym] = dsts
-        transitions = defaultdict(set)
-        for key, dsts in self.transitions.items():
-            src, sym = key
-            if src == state:
-                continue
-
+        for sym, dsts in self._out.get(state, _NO_EDGES).items():
             if state in dsts:
-                for out_sym, out_dsts in outgoing_transitions.items():
-                    if safe:
-                        if sym != '' and out_sym != '':
-                            return None
-                        new_sym = out_sym if sym == '' else sym
-                        transitions[src, new_sym].update(out_dsts)
-                    else:
-                        new_sym = combiner(sym, self_loops, out_sym)
-
-                        if (src, new_sym) not in transitions and new_sym != '':
-                            self.alphabet.add(new_sym)
-                        transitions[src, new_sym].update(out_dsts)
+                if len(dsts) > 1:
+                    outgoing_transitions[sym] = dsts.difference((state,))
+                if sym != '':
+                    self_loops.add(sym)
+            else:
+                outgoing_transitions[sym] = dsts
+        if combiner is _default_rip_combiner:
+            # The self-loop alternation is the same for every ripped edge, so join it once
+            combiner = functools.partial(_default_rip_combiner, repeat='|'.join(str(sym) for sym in self_loops))
+        incoming_transitions = [key for key in self._in.get(state, ()) if key[0] != state]
+        if safe and any(sym != '' for _, sym in incoming_transitions) and \
+                any(out_sym != '' for out_sym in outgoing_transitions):
+            return None
+
+        self._invalidate_eps()
+        for sym, dsts in self._out.pop(state, {}).items():
+            del self.transitions[state, sym]
+            for dst in dsts:
+                self._in[dst].discard((state, sym))
+        # Bypass edges are staged per (src, sym) so that each resulting key is added to the indexes once
+        staged = {}
+        for key in incoming_transitions:
+            src, sym = key
+            for out_sym, out_dsts in outgoing_transitions.items():
                 if safe:
-                    dsts = dsts.difference((state,))
+                    new_sym = out_sym if sym == '' else sym
                 else:
-                    dsts.remove(state)
-            if len(dsts) > 0:
-                transitions[key].update(dsts)
+                    new_sym = combiner(sym, self_loops, out_sym)
+                    if new_sym != '':
+                        self.alphabet.add(new_sym)
+                staged.setdefault((src, new_sym), []).append(out_dsts)
+            dsts = self.transitions[key]
+            dsts.discard(state)
+            if len(dsts) == 0:
+                del self.transitions[key]
+                del self._out[src][sym]
+        for key, dst_sets in staged.items():
+            src, sym = key
+            self.add_transitions(src, sym, set().union(*dst_sets))
+        self._in.pop(state, None)
         self.states.remove(state)
-        self.transitions = transitions
+        if state == self._min_state or state == self._max_state:
+            self._update_bounds()
         return self
 
     def union_edges(self, combiner: Optional[Callable[[Iterable[_S | _T]], _S]] = None) -> NFA[_T | str]:
         if combiner is None:
             combiner = _default_union_combiner
-        edges = defaultdict(set)
+        # Symbols per (src, dst) pair, keyed by the pair packed into one int (states are below 2 ** 32). Each
+        # (src, sym, dst) triple occurs once, so the symbols can go in a list.
+        edges = {}
         for key, dsts in self.transitions.items():
             src, sym = key
             for dst in dsts:
-                edges[(src, dst)].add(sym)
-        transitions = defaultdict(set)
+                edge = src << 32 | dst
+                syms = edges.get(edge)
+                if syms is None:
+                    edges[edge] = [sym]
+                else:
+                    syms.append(sym)
+        self.transitions, self._out, self._in = defaultdict(set), {}, {}
+        self._invalidate_eps()
         for edge, syms in edges.items():
-            src, dst = edge
             new_sym = combiner(syms)
             if new_sym != '':
                 self.alphabet.add(new_sym)
-            transitions[src, new_sym].add(dst)
-        self.transitions = transitions
+            self.add_transitions(edge >> 32, new_sym, (edge & 0xFFFFFFFF,))
         return self
 
     def renumber_states(self) -> NFA[_T]:
-        if len(self.states.intersection(range(len(self.states)))) == 0:
+        if self.states == set(range(len(self.states))):
             return self
 
         state_map = dict(zip(self.states, range(len(self.states))))
-        transitions = {}
-        for key, dsts in self.transitions:
+        transitions = defaultdict(set)
+        for key, dsts in self.transitions.items():
             src, sym = key
-            transitions[(state_map[src], sym)] = set(state_map[dst] for dst in dsts)
+            transitions[(state_map[src], sym)] = {state_map[dst] for dst in dsts}
         self.states = set(range(len(self.states)))
         self.transitions = transitions
         self.start_state, self.final_state = state_map[self.start_state], state_map[self.final_state]
+        self._reindex()
+        self._update_bounds()
         return self
 
     def eps_closure(self, state: int, include_state=False) -> set[int]:
-        retval = set()
+        closure = self._eps_sets.get(state)
+        if closure is None:
+            visited = set()
+            stack = list(self._out.get(state, _NO_EDGES).get('', ()))
+            while len(stack) > 0:
+                curr = stack.pop()
+                if curr in visited:
+                    continue
+                visited.add(curr)
+                stack.extend(self._out.get(curr, _NO_EDGES).get('', ()))
+            closure = self._eps_sets[state] = frozenset(visited)
+        retval = set(closure)
         if include_state:
             retval.add(state)
-        if (state, '') not in self.transitions:
-            return retval
-        worklist = set(self.transitions[state, ''])
-        while len(worklist) > 0:
-            curr = worklist.pop()
-            retval.add(curr)
-            if (curr, '') in self.transitions:
-                for st in self.transitions[curr, '']:
-                    if st not in retval:
-                        worklist.add(st)
         return retval
 
     def next_states(self, current_state: int, sym: _T, incl_eps=False) -> set[int]:
         if sym not in self.alphabet:
             return set()
 
-        retval = set()
-        for state in (current_state, *self.eps_closure(current_state)):
-            if (state, sym) in self.transitions:
-                for next_state in self.transitions[state, sym]:
-                    retval.add(next_state)
-                    if incl_eps:
-                        retval.update(self.eps_closure(next_state))
+        row = self._delta_cache.get(current_state)
+        if row is None:
+            merged = {}
+            for state in (current_state, *self.eps_closure(current_state)):
+                for edge_sym, dsts in self._out.get(state, _NO_EDGES).items():
+                    merged.setdefault(edge_sym, set()).update(dsts)
+            row = self._delta_cache[current_state] = {edge_sym: frozenset(dsts) for edge_sym, dsts in merged.items()}
+        retval = set(row.get(sym, ()))
+        if incl_eps:
+            for next_state in row.get(sym, ()):
+                retval.update(self.eps_closure(next_state))
         return retval
 
     def accept(self, string: Sequence[_T]) -> bool:
-        return self._accept(string, 0, self.start_state)
-
-    def _accept(self, string: Sequence[_T], start_index: int, current_state: int) -> bool:
-        if start_index == len(string):
-            return current_state == self.final_state or self.final_state in self.eps_closure(current_state)
-        return any(self._accept(string, start_index + 1, state)
-                   for state in self.next_states(current_state, string[start_index]))
-
-    def to_dfa(self, complete=False) -> dfa.DFA[_T]:
-        eps_memo = {self.start_state: self.eps_closure(self.start_state, include_state=True)}
-        state_list: list[set[int]] = [eps_memo[self.start_state]]
-        transitions = {}
-        worklist = [0]
+        # Advance every path at once: current is the epsilon-closed set of active states, as a bitmask
+        current = self._eps_mask(self.start_state)
+        for sym in string:
+            current = self._step(current, sym)
+            if current == 0:
+                return False
+        return bool(current >> self.final_state & 1)
+
+    def online_accept(self, string: Sequence[_T]) -> bool:
+        # Same as accept, but every step is remembered, so repeated calls run on a DFA built lazily as far as the
+        # strings seen so far need. State masks already identify subsets, so they serve as the DFA's state ids. Once
+        # _ONLINE_MOVES_LIMIT steps are stored, new ones are still taken but no longer kept.
+        moves = self._online_moves
+        current = self._eps_mask(self.start_state)
+        for sym in string:
+            key = (current, sym)
+            next_mask = moves.get(key)
+            if next_mask is None:
+                next_mask = self._step(current, sym)
+                if len(moves) < _ONLINE_MOVES_LIMIT:
+                    moves[key] = next_mask
+            if next_mask == 0:
+                return False
+            current = next_mask
+        return bool(current >> self.final_state & 1)
+
+    def _step(self, current: int, sym: _T) -> int:
+        # One step of accept and online_accept: the epsilon-closed mask of the states reached from current on sym
+        if sym not in self.alphabet:
+            return 0
+        eps_masks = self._eps_cache
+        next_mask = 0
+        while current:
+            low = current & -current
+            for dst in self._out.get(low.bit_length() - 1, _NO_EDGES).get(sym, ()):
+                next_mask |= eps_masks[dst] if dst in eps_masks else self._eps_mask(dst)
+            current ^= low
+        return next_mask
+
+    def _eps_mask(self, state: int) -> int:
+        # Epsilon closure of state, including state, as a bitmask over state numbers. Cached closures are merged
+        # whole rather than walked again.
+        cache = self._eps_cache
+        if state in cache:
+            return cache[state]
+        mask = 1 << state
+        worklist = [state]
         while len(worklist) > 0:
-            current_state = worklist.pop()
-
-            if len(state_list[current_state]) == 0:
-                for sym in self.alphabet:
-                    transitions[(current_state, sym)] = current_state
-                continue
+            for dst in self._out.get(worklist.pop(), _NO_EDGES).get('', ()):
+                if not mask >> dst & 1:
+                    if dst in cache:
+                        mask |= cache[dst]
+                    else:
+                        mask |= 1 << dst
+                        worklist.append(dst)
+        cache[state] = mask
+        return mask
 
-            for sym in self.alphabet:
-                result_states = set()
-                for state in state_list[current_state]:
-                    if (state, sym) in self.transitions:
-                        result_states.update(self.transitions[state, sym])
-                next_state = set()
-                for state in result_states:
-                    if state not in eps_memo:
-                        eps_memo[state] = self.eps_closure(state, include_state=True)
-                    next_state.update(eps_memo[state])
-                if not complete and len(next_state) == 0:
-                    continue
-                if next_state in state_list:
-                    transitions[current_state, sym] = state_list.index(next_state)
-                else:
-                    transitions[current_state, sym] = len(state_list)
-                    worklist.append(len(state_list))
-                    state_list.append(next_state)
-        final_states = (i for i, states in enumerate(state_list) if self.final_state in states)
-        return dfa.DFA(range(len(state_list)), self.alphabet, transitions, 0, final_states)
+    def to_dfa(self, complete=False) -> dfa.DFA[_T]:
+        # Symbols are relabelled 0..k-1 and each state's edges become (sym_id, mask) pairs, where mask is the
+        # epsilon closure of everything the state reaches on that symbol, so the construction itself only
+        # touches ints
+        alphabet = list(self.alphabet)
+        sym_ids = {sym: index for index, sym in enumerate(alphabet)}
+        rows = [()] * (self._max_state + 1)
+        for src, edges in self._out.items():
+            row = []
+            for sym, dsts in edges.items():
+                if sym in sym_ids:
+                    mask = 0
+                    for dst in dsts:
+                        mask |= self._eps_mask(dst)
+                    row.append((sym_ids[sym], mask))
+            rows[src] = tuple(row)
+
+        subsets, table = _subset_construct(self._eps_mask(self.start_state), rows, len(alphabet), complete)
+        final_bit = 1 << self.final_state
+        final_states = (i for i, subset in enumerate(subsets) if subset & final_bit)
+        return dfa.DFA.from_table(len(subsets), alphabet, table, final_states)
+
+    def minimize(self) -> NFA[_T]:
+        minimal = self.to_dfa().minimize().to_nfa()
+        self.states, self.transitions = minimal.states, minimal.transitions
+        self.start_state, self.final_state = minimal.start_state, minimal.final_state
+        self._reindex()
+        self._update_bounds()
+        return self
 
     def degree(self, state: int) -> int:
-        in_degree = sum(1 for dst in self.transitions.values() if dst == state)
-        out_degree = sum(1 for sym in self.alphabet if (state, sym) in self.transitions)
-        return in_degree + out_degree
+        return len(self._in.get(state, ())) + len(self._out.get(state, _NO_EDGES))
 
     def in_out_sets(self, state: int) -> tuple[set[tuple[int, _T]], set[tuple[int, _T]]]:
-        in_set = set()
-        out_set = set()
-        for key, dsts in self.transitions.items():
-            src, sym = key
-            if src == state:
-                out_set.update((dst, sym) for dst in dsts)
-            if state in dsts:
-                in_set.add(key)
+        in_set = set(self._in.get(state, ()))
+        out_set = {(dst, sym) for sym, dsts in self._out.get(state, _NO_EDGES).items() for dst in dsts}
         return in_set, out_set
 
     def dump(self,
@@ -296,35 +497,75 @@ class NFA(Generic[_T]):
         dot.render(directory=directory)
 
 
-def _default_rip_combiner(a: str | _T, b: Iterable[str | _T], c: str | _T) -> str:
+def _subset_construct(start: int,
+                      rows: Sequence[tuple[tuple[int, int], ...]],
+                      num_syms: int,
+                      complete: bool) -> tuple[list[int], list[int]]:
+    # Subset construction over bitmask subsets. Returns the subsets in DFA state order and a flat row-major table of
+    # DFA transitions, with -1 for missing ones; when complete, the empty subset is kept as a dead state instead.
+    # Subsets are consumed a byte at a time: the successors of each (byte position, byte value) are merged once and
+    # memoized, so a subset costs one lookup per nonzero byte instead of a pass over each of its states' edges
+    chunk_rows = {}
+    subsets = [start]
+    seen = {start: 0}
+    table = []
+    for subset in subsets:
+        next_masks = [0] * num_syms
+        offset = 0
+        while subset:
+            chunk = subset & 0xFF
+            if chunk:
+                key = offset << 8 | chunk
+                chunk_row = chunk_rows.get(key)
+                if chunk_row is None:
+                    merged = {}
+                    while chunk:
+                        low = chunk & -chunk
+                        for sym, mask in rows[offset + low.bit_length() - 1]:
+                            merged[sym] = merged.get(sym, 0) | mask
+                        chunk ^= low
+                    chunk_row = chunk_rows[key] = tuple(merged.items())
+                for sym, mask in chunk_row:
+                    next_masks[sym] |= mask
+            subset >>= 8
+            offset += 8
+        for next_state in next_masks:
+            if next_state == 0 and not complete:
+                table.append(-1)
+                continue
+            dfa_state = seen.get(next_state)
+            if dfa_state is None:
+                dfa_state = seen[next_state] = len(subsets)
+                subsets.append(next_state)
+            table.append(dfa_state)
+    return subsets, table
+
+
+def _default_rip_combiner(a: str | _T, b: Iterable[str | _T], c: str | _T, repeat: Optional[str] = None) -> str:
     pre, post = str(a), str(c)
-    repeat = '|'.join(str(sym) for sym in b)
-    loop_pre, loop_post = pre == repeat, post == repeat
-    if loop_pre and loop_post:
-        new_sym = '' if repeat == '' else '(' + repeat + ')+'
-    elif loop_pre:
-        new_sym = post if repeat == '' else '(' + repeat + ')+' + post
-    elif loop_post:
-        new_sym = pre if repeat == '' else pre + '(' + repeat + ')+'
-    else:
-        new_sym = pre + ('' if repeat == '' else '(' + repeat + ')*') + post
-    return new_sym
+    if repeat is None:
+        repeat = '|'.join(str(sym) for sym in b)
+    if repeat == '':
+        return pre + post
+    if pre == repeat:
+        return f'({repeat})+' if post == repeat else f'({repeat})+{post}'
+    if post == repeat:
+        return f'{pre}({repeat})+'
+    return f'{pre}({repeat})*{post}'
 
 
 def _default_union_combiner(syms: Iterable[str | _T]) -> str:
-    new_sym = ''
+    options = []
     optional = False
     for sym in syms:
         if sym == '':
             optional = True
-        elif new_sym == '':
-            new_sym = str(sym)
         else:
-            new_sym += '|' + str(sym)
+            options.append(str(sym))
+    new_sym = '|'.join(options)
     if optional and new_sym != '':
-        return '(' + new_sym + ')?'
-    else:
-        return new_sym
+        return f'({new_sym})?'
+    return new_sym
 
 
 def _default_edge_label_function(syms: Iterable[_T]) -> str:
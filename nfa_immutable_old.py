@@ -28,6 +28,8 @@ class NFA(Generic[_T]):
         self.transitions = transitions.copy()
         self.start_state = start_state
         self.final_state = final_state
+        # In-degree plus out-degree per state, counted on the first call to degree
+        self._degrees: Optional[dict[int, int]] = None
 
     def __add__(self, other: NFA[_S]) -> NFA[_S | _T]:
         alphabet = self.alphabet.union(other.alphabet)
@@ -177,12 +179,12 @@ class NFA(Generic[_T]):
         return NFA(self.states, frozenset(alphabet), transitions, self.start_state, self.final_state)
 
     def renumber_states(self) -> NFA[_T]:
-        if len(self.states.intersection(range(len(self.states)))) == 0:
+        if self.states == set(range(len(self.states))):
             return self
 
         state_map = dict(zip(self.states, range(len(self.states))))
         transitions = {}
-        for key, dsts in self.transitions:
+        for key, dsts in self.transitions.items():
             src, sym = key
             transitions[(state_map[src], sym)] = frozenset(state_map[dst] for dst in dsts)
         return NFA(frozenset(range(len(self.states))),
@@ -230,6 +232,7 @@ class NFA(Generic[_T]):
     def to_dfa(self, complete=False) -> dfa.DFA[_T]:
         eps_memo = {self.start_state: self.eps_closure(self.start_state).union((self.start_state,))}
         state_list: list[frozenset[int]] = [frozenset(eps_memo[self.start_state])]
+        index: dict[frozenset[int], int] = {state_list[0]: 0}
         transitions = {}
         worklist = [0]
         while len(worklist) > 0:
@@ -253,19 +256,23 @@ class NFA(Generic[_T]):
                 if not complete and len(next_state) == 0:
                     continue
                 next_frozen = frozenset(next_state)
-                if next_state in state_list:
-                    transitions[(current_state, sym)] = state_list.index(next_frozen)
-                else:
-                    transitions[(current_state, sym)] = len(state_list)
-                    worklist.append(len(state_list))
+                dfa_state = index.get(next_frozen)
+                if dfa_state is None:
+                    dfa_state = index[next_frozen] = len(state_list)
+                    worklist.append(dfa_state)
                     state_list.append(next_frozen)
+                transitions[(current_state, sym)] = dfa_state
         final_states = frozenset(i for i, states in enumerate(state_list) if self.final_state in states)
         return dfa.DFA(frozenset(range(len(state_list))), self.alphabet, transitions, 0, final_states)
 
     def degree(self, state: int) -> int:
-        in_degree = sum(True for dst in self.transitions.values() if dst == state)
-        out_degree = sum(True for sym in self.alphabet if (state, sym) in self.transitions)
-        return in_degree + out_degree
+        if self._degrees is None:
+            self._degrees = defaultdict(int)
+            for key, dsts in self.transitions.items():
+                self._degrees[key[0]] += 1
+                for dst in dsts:
+                    self._degrees[dst] += 1
+        return self._degrees.get(state, 0)
 
     def in_out_sets(self, state: int) -> tuple[set[tuple[int, _T]], set[tuple[int, _T]]]:
         in_set = set()
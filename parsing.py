@@ -1,5 +1,5 @@
 from collections.abc import Iterable, Sequence
-from typing import NamedTuple, TypeVar
+from typing import NamedTuple, Optional, TypeVar
 
 import itertools
 
@@ -32,58 +32,73 @@ _operators = {
 }
 _operators.update({op.id: op for _, op in _operators.items()})
 
+# Operator fields as flat tuples indexed by operator id, for the per-token loops
+_OP_PREC = tuple(_operators[op_id].precedence for op_id in range(7))
+_OP_NUM_ARGS = tuple(_operators[op_id].num_args for op_id in range(7))
+_OP_SUFFIX = tuple(_operators[op_id].suffix for op_id in range(7))
+_OP_COMMUTATIVE = tuple(_operators[op_id].commutative for op_id in range(7))
+
 
 def parse_regex(regex: str) -> list[int | str]:
     """Parse the given input regex into postfix notation using the shunting-yard algorithm"""
 
     stack = []
     postfix_output = []
+    emit = postfix_output.append
     concatenate_next = False
-    current_pos = 0
-    while current_pos < len(regex):
+    current_pos, end = 0, len(regex)
+    while current_pos < end:
         sym = regex[current_pos]
-        if sym == '\\':
-            current_pos += 1
-            sym += regex[current_pos]
-            escape = True
-        else:
-            escape = False
-        if concatenate_next and (sym == '(' or sym not in _operators):
-            sym = None
+        op_param = _operators.get(sym)
+        if op_param is None or op_param.id == 5:
+            if concatenate_next:
+                # Implicit concatenation; the current character is read again on the next pass
+                op_id = 0
+            elif op_param is not None:
+                current_pos += 1
+                op_id = 5
+            elif sym == '\\':
+                # An escaped character is always a literal, emitted without its backslash
+                current_pos += 2
+                emit(regex[current_pos - 1])
+                concatenate_next = True
+                continue
+            else:
+                current_pos += 1
+                emit(sym)
+                concatenate_next = True
+                continue
         else:
             current_pos += 1
+            op_id = op_param.id
 
-        op_param = _operators[sym] if sym in _operators else None
-        if sym == '(':
-            stack.append(op_param.id)
+        if op_id == 5:
+            stack.append(op_id)
             if regex[current_pos] == '?':
                 current_pos += 2
                 if regex[current_pos - 1] == '<':
                     if regex[current_pos] not in '!=':
-                        while regex[current_pos - 1] != '>':
-                            current_pos += 1
+                        current_pos = regex.index('>', current_pos - 1) + 1
 
             concatenate_next = False
-        elif sym == ')':
-            while stack[-1] != _operators['('].id:
-                postfix_output.append(stack.pop())
+        elif op_id == 6:
+            while stack[-1] != 5:
+                emit(stack.pop())
             stack.pop()
             concatenate_next = True
-        elif sym in _operators:
-            while len(stack) > 0 and (type(stack[-1]) != int or _operators[stack[-1]].precedence > op_param.precedence):
-                postfix_output.append(stack.pop())
-            if op_param.suffix:
-                postfix_output.append(op_param.id)
+        else:
+            precedence = _OP_PREC[op_id]
+            while len(stack) > 0 and _OP_PREC[stack[-1]] > precedence:
+                emit(stack.pop())
+            if _OP_SUFFIX[op_id]:
+                emit(op_id)
                 concatenate_next = True
             else:
-                stack.append(op_param.id)
+                stack.append(op_id)
                 concatenate_next = False
-        else:
-            postfix_output.append(sym[1:] if escape else sym)
-            concatenate_next = True
 
     while len(stack) > 0:
-        postfix_output.append(stack.pop())
+        emit(stack.pop())
 
     return postfix_output
 
@@ -93,23 +108,15 @@ def construct_string(postfix: list[int | str]) -> str:
         return ''
     stack = []
     for sym in postfix:
-        if type(sym) == int:
+        if sym.__class__ is int:
+            precedence = _OP_PREC[sym]
             args = []
-            for _ in range(_operators[sym].num_args):
+            for _ in range(_OP_NUM_ARGS[sym]):
                 arg, op = stack.pop()
-                if op is not None and _operators[op].precedence < _operators[sym].precedence:
-                    arg = '(' + arg + ')'
+                if op is not None and _OP_PREC[op] < precedence:
+                    arg = f'({arg})'
                 args.append(arg)
-            if sym == 0:
-                stack.append((args[1] + args[0], sym))
-            elif sym == 1:
-                stack.append((args[1] + '|' + args[0], sym))
-            elif sym == 2:
-                stack.append((args[0] + '*', sym))
-            elif sym == 3:
-                stack.append((args[0] + '+', sym))
-            elif sym == 4:
-                stack.append((args[0] + '?', sym))
+            stack.append((_FORMATTERS[sym](args), sym))
         else:
             stack.append((sym, None))
     if len(stack) != 1:
@@ -117,43 +124,117 @@ def construct_string(postfix: list[int | str]) -> str:
     return stack[0][0]
 
 
+# String form of each postfix operator id, given its operands in popped order (the right operand first)
+_FORMATTERS = (
+    lambda args: args[1] + args[0],
+    lambda args: f'{args[1]}|{args[0]}',
+    lambda args: args[0] + '*',
+    lambda args: args[0] + '+',
+    lambda args: args[0] + '?',
+)
+
+
 def parse_regex_as_string(regex: str) -> str:
     return construct_string(parse_regex(regex))
 
 
-def construct_nfa(postfix: list[int | str], use_eps=False) -> NFA[str]:
+def construct_nfa(postfix: Sequence[int | str],
+                  use_eps=False,
+                  cache: Optional[dict[tuple[tuple[int | str, ...], bool], NFA[str]]] = None) -> NFA[str]:
+    # With a cache, regexes up to _CACHED_POSTFIX_LEN tokens are built from the NFAs of their subexpressions, which
+    # are kept in it for later calls; callers pass the same dict across a sweep of related regexes and drop it after
     if len(postfix) == 0:
         return NFA(frozenset((0,)), frozenset(), {}, 0, 0)
+    if cache is not None and len(postfix) <= _CACHED_POSTFIX_LEN:
+        return _construct_subtrees(tuple(postfix), use_eps, cache)
 
+    # Runs of concatenations or unions are collected as (op, parts) entries and built in one go when an operand of
+    # some other operator, so a chain of n parts is joined once rather than n - 1 times; finished NFAs are (None, nfa)
     stack = []
     for sym in postfix:
-        if type(sym) == int:
-            syms = list(stack.pop() for _ in range(_operators[sym].num_args))
-            if sym == 0:
-                stack.append(syms[1] + syms[0])
-            elif sym == 1:
-                stack.append(syms[1] | syms[0])
-            elif sym == 2:
-                stack.append(syms[0].star())
-            elif sym == 3:
-                stack.append(syms[0].plus())
-            elif sym == 4:
-                stack.append(syms[0].opt())
-        elif use_eps:
-            stack.append(NFA((0, 1, 2),
-                             () if sym is None else (sym,),
-                             {(0, sym): (1,), (1, ''): (2,)},
-                             0,
-                             2))
+        if sym.__class__ is int:
+            if sym == 0 or sym == 1:
+                right, left = stack.pop(), stack.pop()
+                parts = left[1] if left[0] == sym else [_join_parts(*left)]
+                parts.extend(right[1] if right[0] == sym else (_join_parts(*right),))
+                stack.append((sym, parts))
+                continue
+            stack.append((None, _NFA_BUILDERS[sym](_join_parts(*stack.pop()))))
         else:
-            stack.append(NFA((0, 1),
-                             () if sym is None else (sym,),
-                             {(0, sym): (1,)},
-                             0,
-                             1))
+            stack.append((None, _literal_nfa(sym, use_eps)))
     if len(stack) != 1:
         raise ValueError
-    return stack[0]
+    return _join_parts(*stack[0])
+
+
+# Regexes up to this many postfix tokens are built from cached subexpressions. Enumerated regexes share most of
+# their subexpressions, so each is built once; longer regexes are built directly without recursing.
+_CACHED_POSTFIX_LEN = 64
+
+
+def _construct_subtrees(postfix: tuple[int | str, ...],
+                        use_eps: bool,
+                        cache: dict[tuple[tuple[int | str, ...], bool], NFA[str]]) -> NFA[str]:
+    # Builds a new NFA from the cached NFAs of the operands of the last operator. concat_all and union_all copy
+    # their parts into a new NFA and star, plus and opt are given a copy, so cached NFAs are never modified and the
+    # NFA returned shares nothing with them.
+    op = postfix[-1]
+    if op.__class__ is not int:
+        if len(postfix) != 1:
+            raise ValueError
+        return _literal_nfa(op, use_eps)
+    if op > 1:
+        return _NFA_BUILDERS[op](_construct_cached(postfix[:-1], use_eps, cache).copy())
+
+    # Peel the right operands off a run of the same binary operator; concat_all and union_all leave their parts as
+    # they are, so the shared NFAs can be passed in directly
+    parts = []
+    while postfix[-1] == op:
+        split, needed = len(postfix) - 1, 1
+        while needed > 0:
+            split -= 1
+            if split < 0:
+                raise ValueError
+            sym = postfix[split]
+            needed += _OP_NUM_ARGS[sym] - 1 if sym.__class__ is int else -1
+        parts.append(_construct_cached(postfix[split:-1], use_eps, cache))
+        postfix = postfix[:split]
+        if len(postfix) == 0:
+            raise ValueError
+    parts.append(_construct_cached(postfix, use_eps, cache))
+    parts.reverse()
+    return _NFA_BUILDERS[op](parts)
+
+
+def _construct_cached(postfix: tuple[int | str, ...],
+                      use_eps: bool,
+                      cache: dict[tuple[tuple[int | str, ...], bool], NFA[str]]) -> NFA[str]:
+    nfa = cache.get((postfix, use_eps))
+    if nfa is None:
+        nfa = cache[postfix, use_eps] = _construct_subtrees(postfix, use_eps, cache)
+    return nfa
+
+
+def _literal_nfa(sym: str, use_eps: bool) -> NFA[str]:
+    if use_eps:
+        return NFA((0, 1, 2),
+                   () if sym is None else (sym,),
+                   {(0, sym): (1,), (1, ''): (2,)},
+                   0,
+                   2)
+    return NFA((0, 1),
+               () if sym is None else (sym,),
+               {(0, sym): (1,)},
+               0,
+               1)
+
+
+def _join_parts(op: None | int, parts: NFA[str] | list[NFA[str]]) -> NFA[str]:
+    return parts if op is None else _NFA_BUILDERS[op](parts)
+
+
+# NFA builder for each postfix operator id: the binary operators take their whole run of operands at once
+_NFA_BUILDERS = (NFA.concat_all, NFA.union_all, NFA.star, NFA.plus, NFA.opt)
 
 
 def parse_regex_as_nfa(regex: str, use_eps=False) -> NFA[str]:
@@ -234,22 +315,28 @@ _duplicate_quantifiers = {
 
 
 def _op_if_nonempty(op: None | str | int, *args: list[_T | int], simplify: bool = True) -> list[_T | int]:
-    op_param = _operators[op]
+    op_id = _operators[op].id
+    num_args = _OP_NUM_ARGS[op_id]
+    if _OP_COMMUTATIVE[op_id] and len(args) > 1:
+        if len(args) == 2:
+            if len(args[0]) > len(args[1]):
+                args = (args[1], args[0])
+        else:
+            args = sorted(args, key=len)
     rv = []
     num_operands = 0
-    for arg in sorted(args, key=len) if op_param.commutative else args:
+    for arg in args:
         if len(arg) > 0:
             rv.extend(arg)
             num_operands += 1
     if num_operands == 0:
         return []
-    if num_operands != op_param.num_args and (num_operands - 1) % (op_param.num_args - 1) != 0:
+    if num_operands != num_args and (num_operands - 1) % (num_args - 1) != 0:
         raise ValueError('Invalid number of operands')
-    num_operators = 1 if op_param.num_args == 1 else (num_operands - 1) // (op_param.num_args - 1)
+    num_operators = 1 if num_args == 1 else (num_operands - 1) // (num_args - 1)
 
-    op_id = op_param.id
-    if simplify and (rv[-1], op_param.id) in _duplicate_quantifiers:
-        op_id = _duplicate_quantifiers[(rv[-1], op_param.id)]
+    if simplify and (rv[-1], op_id) in _duplicate_quantifiers:
+        op_id = _duplicate_quantifiers[(rv[-1], op_id)]
         rv.pop()
 
     for _ in range(num_operators):
@@ -259,30 +346,25 @@ def _op_if_nonempty(op: None | str | int, *args: list[_T | int], simplify: bool
 
 def enumerate_regexes(alphabet: Iterable[str],
                       length: int,
-                      allow_empty_str=False) -> list[list[str | int]]:
-    return _enumerate_regexes(alphabet, length, allow_empty_str, {})
-
-
-def _enumerate_regexes(alphabet: Iterable[str],
-                       length: int,
-                       allow_empty_str: bool,
-                       memo: dict[int, list[list[str | int]]]) -> list[list[str | int]]:
-    if length in memo:
-        return memo[length]
-    if length == 0:
-        memo[0] = [['']] if allow_empty_str else []
-        return memo[0]
-    retval = []
-    if length == 1:
-        retval.extend([sym] for sym in alphabet)
-    for op in (None, '|', '*'):
-        n_args = _operators[op].num_args
-        allow_empty = op == '|' and allow_empty_str
-        for comb in itertools.combinations(range(length) if allow_empty else range(1, length - 1), n_args - 1):
-            part_lists = (_enumerate_regexes(alphabet, hi - lo, allow_empty_str, memo)
-                          for lo, hi in itertools.pairwise((0, *comb, length - 1)))
-            for parts in itertools.product(*part_lists):
-                retval.append(sum(parts, start=[]) + [_operators[op].id])
-    memo[length] = retval
-    return retval
+                      allow_empty_str=False) -> list[tuple[str | int, ...]]:
+    # Built bottom-up: the regexes of each length are combined from all shorter ones, from the empty string up
+    memo: list[list[tuple[str | int, ...]]] = [[('',)] if allow_empty_str else []]
+    for curr_length in range(1, length + 1):
+        retval = []
+        if curr_length == 1:
+            retval.extend((sym,) for sym in alphabet)
+        for op in (None, '|', '*'):
+            n_args, suffix = _operators[op].num_args, (_operators[op].id,)
+            allow_empty = op == '|' and allow_empty_str
+            for comb in itertools.combinations(range(curr_length) if allow_empty else range(1, curr_length - 1),
+                                               n_args - 1):
+                part_lists = (memo[hi - lo] for lo, hi in itertools.pairwise((0, *comb, curr_length - 1)))
+                # Each operator takes one or two operands; joining them directly avoids summing tuples. A starred
+                # regex is never starred again, since (r*)* matches the same strings as r*.
+                if n_args == 1:
+                    retval.extend(part + suffix for part, in itertools.product(*part_lists) if part[-1] != 2)
+                else:
+                    retval.extend(left + right + suffix for left, right in itertools.product(*part_lists))
+        memo.append(retval)
+    return memo[length]
 
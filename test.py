@@ -1,7 +1,10 @@
+import heapq
 import itertools
 import os
 import re
 
+import numpy as np
+
 from nfa import NFA
 import parsing
 
@@ -14,32 +17,45 @@ if __name__ == '__main__':
     pattern = 'a(aa)*b*'
     ts = parsing.parse_regex(pattern)
 
+    # Subexpression NFAs shared by the enumerated regexes, kept for this sweep only
+    nfa_cache = {}
     for n in range(6, 8):
         for ts in parsing.enumerate_regexes('abc', n):
             # print(ts)
 
-            if (2, 2) in itertools.pairwise(ts):
-                continue
             # if any(c not in ts for c in 'abc'):
             #     continue
             # if len([t for t in ts if t is not None and t in 'ab']) < 4:
             #     continue
 
-            onfa = parsing.construct_nfa(ts)
+            onfa = parsing.construct_nfa(ts, cache=nfa_cache)
             onfa.dump('./graphs', 'onfa', caption='\n/' + parsing.construct_string(ts) + '/')
             empty = NFA(frozenset((0, 1)), frozenset(), {(0, ''): frozenset((1,))}, 0, 1)
             nfa = onfa.to_dfa().minimize().to_nfa()
             nfa = (empty + nfa).union_edges(combiner=parsing.postfix_union_combiner)
             heuristic = lambda state, in_set, out_set: sum(len(sym) for dst, sym in in_set if dst != state) * len(out_set) + \
                                                        sum(len(sym) for src, sym in out_set if src != state) * len(in_set)
+            # Ripping a state only changes the edges of its neighbours, so only their costs are recomputed; entries
+            # left in the heap with an outdated cost are skipped
+            costs = {state: heuristic(state, *nfa.in_out_sets(state))
+                     for state in nfa.states if state != nfa.start_state and state != nfa.final_state}
+            cost_heap = [(cost, state) for state, cost in costs.items()]
+            heapq.heapify(cost_heap)
             while len(nfa.states) > 2:
                 # nfa.dump('./graphs', 'nfa' + str(len(nfa.states)), edge_label=parsing.postfix_edge_label_func)
                 # print({state: nfa.in_out_sets(state) for state in nfa.states})
-                rip_state = min((state for state in nfa.states if state != nfa.start_state and state != nfa.final_state),
-                                key=lambda s: heuristic(s, *nfa.in_out_sets(s)))
+                cost, rip_state = heapq.heappop(cost_heap)
+                if costs.get(rip_state) != cost:
+                    continue
+                del costs[rip_state]
+                in_set, out_set = nfa.in_out_sets(rip_state)
                 # print(str(len(nfa.states)), rip_state)
                 nfa = nfa.rip(rip_state, combiner=parsing.postfix_rip_combiner)
                 nfa = nfa.union_edges(combiner=parsing.postfix_union_combiner)
+                for state in {src for src, _ in in_set} | {dst for dst, _ in out_set}:
+                    if state in costs:
+                        costs[state] = heuristic(state, *nfa.in_out_sets(state))
+                        heapq.heappush(cost_heap, (costs[state], state))
             # for s in (11, 4, 5, 3, 7, 14, 15, 13, 17, 0, 1, 19):
             #     nfa = nfa.rip(s, combiner=parsing.postfix_rip_combiner).union_edges(combiner=parsing.postfix_union_combiner)
             # nfa.dump('./graphs', 'nfa' + str(len(nfa.states)), edge_label=parsing.postfix_edge_label_func)
@@ -58,15 +74,25 @@ if __name__ == '__main__':
             new_regex = parsing.construct_string(next(iter(nfa.transitions))[1])
             # print('/' + new_regex + '/')
 
+            regex_pattern, new_pattern = re.compile(regex_string), re.compile(new_regex)
+            alphabet = list(onfa.alphabet)
+            table, accepting, start = mdfa.to_numpy_table(alphabet)
             for n in range(min(len(nfa.transitions), len(mdfa.transitions)) + 2):
-                for seq in itertools.product(onfa.alphabet, repeat=n):
+                # Run the minimized DFA over every string of length n at once; row i of inputs holds the symbol
+                # indices at position i, in the same order as itertools.product
+                inputs = np.indices((len(alphabet),) * n).reshape(n, len(alphabet) ** n)
+                dfa_states = np.full(len(alphabet) ** n, start)
+                for column in inputs:
+                    dfa_states = table[dfa_states, column]
+                dfa_accepts = accepting[dfa_states].tolist()
+                for seq, dfa_acc in zip(itertools.product(alphabet, repeat=n), dfa_accepts):
                     st = ''.join(seq)
-                    re_match = re.fullmatch(regex_string, st) is not None
-                    new_match = re.fullmatch(new_regex, st) is not None
+                    re_match = regex_pattern.fullmatch(st) is not None
+                    new_match = new_pattern.fullmatch(st) is not None
                     nfa_acc = onfa.accept(st)
-                    dfa_acc = mdfa.accept(st)
-                    if re_match != nfa_acc or dfa_acc != re_match or re_match != new_match:
-                        print(st, '/' + regex_string + '/', re_match, new_match, nfa_acc, dfa_acc)
+                    online_acc = onfa.online_accept(st)
+                    if re_match != nfa_acc or nfa_acc != online_acc or dfa_acc != re_match or re_match != new_match:
+                        print(st, '/' + regex_string + '/', re_match, new_match, nfa_acc, online_acc, dfa_acc)
                         onfa.dump('./graphs', 'onfa')
                         mdfa.dump('./graphs', 'mdfa')
                         exit(1)